@@ -22,6 +22,7 @@ def divide(a, b):
 
 class Calculator:
     """A simple calculator class."""
+    __slots__ = ("value",)
     
     def __init__(self, initial_value=0):
         """Initialize with an optional starting value."""
@@ -2,26 +2,31 @@
 Simple test client for Python LSP server
 """
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import os
 
 # LSP server endpoint
 LSP_SERVER_URL = "http://localhost:8000"
 
-def get_completions(code, line, character):
+# Shared session so requests reuse pooled keep-alive connections to the
+# server instead of opening a new TCP connection each time
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+def make_completion_params(code, line, character, limit=None):
     """
-    Get code completions at the specified position.
+    Build the request body for a completion at the specified position.
     
     Args:
         code (str): The Python code
         line (int): 0-based line number
         character (int): 0-based character position
+        limit (int): Maximum number of items, or None for the server default
     
     Returns:
-        List of completion items
+        Completion request parameters
     """
-    endpoint = f"{LSP_SERVER_URL}/completion"
-    
     data = {
         "text_document": {
             "text": code
@@ -31,14 +36,105 @@ def get_completions(code, line, character):
             "character": character
         }
     }
+    if limit is not None:
+        data["limit"] = limit
+    return data
+
+def get_completion_list(code, line, character, limit=None):
+    """
+    Get the completion response at the specified position.
+    
+    Args:
+        code (str): The Python code
+        line (int): 0-based line number
+        character (int): 0-based character position
+        limit (int): Maximum number of items, or None for the server default
+    
+    Returns:
+        Dict with the completion "items" and the "is_incomplete" flag
+    """
+    endpoint = f"{LSP_SERVER_URL}/completion"
+    
+    data = make_completion_params(code, line, character, limit)
+    
+    response = SESSION.post(endpoint, json=data)
+    if response.status_code == 200:
+        return response.json()
+    else:
+        print(f"Error: {response.status_code}, {response.text}")
+        return {"items": [], "is_incomplete": False}
+
+def get_completions(code, line, character):
+    """
+    Get code completions at the specified position.
+    
+    Args:
+        code (str): The Python code
+        line (int): 0-based line number
+        character (int): 0-based character position
+    
+    Returns:
+        List of completion items
+    """
+    return get_completion_list(code, line, character)["items"]
+
+def get_batch_completions(code, positions):
+    """
+    Get code completions for several positions in one request.
+    
+    Args:
+        code (str): The Python code
+        positions (list): (line, character) pairs, 0-based
+    
+    Returns:
+        List of completion responses, one per position
+    """
+    endpoint = f"{LSP_SERVER_URL}/completion/batch"
+    
+    data = [make_completion_params(code, line, character) for line, character in positions]
     
-    response = requests.post(endpoint, json=data)
+    response = SESSION.post(endpoint, json=data)
     if response.status_code == 200:
-        return response.json()["items"]
+        return response.json()
     else:
         print(f"Error: {response.status_code}, {response.text}")
         return []
 
+def resolve_completion(code, line, character, item):
+    """
+    Get a completion item with its documentation filled in.
+    
+    Args:
+        code (str): The Python code the item was completed in
+        line (int): 0-based line number the completion was requested at
+        character (int): 0-based character position the completion was requested at
+        item (dict): Completion item returned by /completion
+    
+    Returns:
+        The resolved completion item, or None on error
+    """
+    endpoint = f"{LSP_SERVER_URL}/completion/resolve"
+    
+    data = {
+        "content_hash": item["data"]["content_hash"],
+        "label": item["label"],
+        "position": {
+            "line": line,
+            "character": character
+        },
+        # Always send the text: the item's Script may be cached in another worker
+        "text_document": {
+            "text": code
+        }
+    }
+    
+    response = SESSION.post(endpoint, json=data)
+    if response.status_code == 200:
+        return response.json()
+    else:
+        print(f"Error: {response.status_code}, {response.text}")
+        return None
+
 def get_diagnostics(code):
     """
     Get diagnostic information (syntax errors) for the given code.
@@ -55,7 +151,7 @@ def get_diagnostics(code):
         "text": code
     }
     
-    response = requests.post(endpoint, json=data)
+    response = SESSION.post(endpoint, json=data)
     if response.status_code == 200:
         return response.json()["diagnostics"]
     else:
@@ -146,6 +242,37 @@ arr."""
     # Test getting completions for local module
     test_completions("LOCAL MODULE COMPLETIONS", code_local_module, 2, 14)
     
+    # Test resolving the documentation of a completion item
+    print("\n=== TESTING COMPLETION RESOLVE ===")
+    local_completions = get_completions(code_local_module, 2, 15)
+    if local_completions:
+        resolved = resolve_completion(code_local_module, 2, 15, local_completions[0])
+        if resolved is not None:
+            print(f"Resolved {resolved['label']}: {resolved['documentation']!r}")
+    else:
+        print("No completions to resolve.")
+    
+    # Test a small completion limit
+    print("\n=== TESTING COMPLETION LIMIT ===")
+    limited = get_completion_list(code_local_module, 2, 15, limit=2)
+    print(f"Got {len(limited['items'])} items with limit=2, is_incomplete={limited['is_incomplete']}")
+    if len(limited["items"]) > 2 or not limited["is_incomplete"]:
+        print("Error: expected at most 2 items and is_incomplete=True")
+    
+    # Test batch completions at two positions in one document
+    print("\n=== TESTING BATCH COMPLETIONS ===")
+    code_batch = """import example_module
+
+calc = example_module.Calculator()
+example_module.
+calc."""
+    batch = get_batch_completions(code_batch, [(3, 15), (4, 5)])
+    for (line, character), result in zip([(3, 15), (4, 5)], batch):
+        labels = [item["label"] for item in result["items"]]
+        print(f"Line {line}, Character {character}: {len(labels)} completions, e.g. {labels[:5]}")
+    if len(batch) != 2:
+        print(f"Error: expected 2 batch responses, got {len(batch)}")
+    
     # Test getting completions for pandas
     if pandas_installed:
         test_completions("PANDAS COMPLETIONS", code_pandas, 3, 3)